@@ -11,40 +11,131 @@ from openai import OpenAI
 
 from openai import OpenAI
 import base64
+import json
+import mmap
 import os
+import tempfile
+import time
 
-# Helper function to encode the image
-def encode_image_to_base64(image_path):
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
+# Multiple of 3 so each chunk encodes without padding and the pieces concatenate cleanly
+ENCODE_CHUNK_SIZE = 3 * 1024 * 1024
+IMAGE_MIME_TYPE = "image/png" # Adjust mime type if necessary
 
-# Path to the image file
-image_path = "./data/competitor_menu.png"
+# Helper function to encode the image as a ready-to-send data URL
+def encode_image_to_data_url(image_path):
+    with open(image_path, "rb") as image_file, \
+            mmap.mmap(image_file.fileno(), 0, access=mmap.ACCESS_READ) as mm, \
+            memoryview(mm) as view:
+        # Encode straight from the mapped file into one preallocated buffer that
+        # already holds the data URL prefix, so the payload is built exactly once
+        prefix = f"data:{IMAGE_MIME_TYPE};base64,".encode('ascii')
+        encoded = bytearray(len(prefix) + 4 * ((len(view) + 2) // 3))
+        encoded[:len(prefix)] = prefix
+        for start in range(0, len(view), ENCODE_CHUNK_SIZE):
+            out = len(prefix) + 4 * (start // 3)
+            chunk = base64.b64encode(view[start:start + ENCODE_CHUNK_SIZE])
+            encoded[out:out + len(chunk)] = chunk
+        return encoded.decode('ascii')
 
-# Check if file exists
-if not os.path.exists(image_path):
-    print(f"Error: Image file '{image_path}' not found.")
-    exit(1)
-
-# Get the base64 encoding of the image
-base64_image = encode_image_to_base64(image_path)
-
-client = OpenAI(
-    base_url='http://192.168.1.23:11434/v1/',
-    api_key='ollama', # required but ignored
-)
-
-chat_completion = client.chat.completions.create(
-    model="gemma3:27b",
-    messages=[
+def build_messages(data_url):
+    return [
         {
             "role": "user",
             "content": [
                 {"type": "text", "text": "Please describe this image in detail:"},
-                {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}}
+                {"type": "image_url", "image_url": {"url": data_url}}
             ]
         }
-    ],
+    ]
+
+# Batch API helpers (OpenAI only; Ollama does not implement /v1/batches)
+def submit_batch(client, requests):
+    # The JSONL holds every base64 image, so keep it out of the repo in a temp dir
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        jsonl_path = os.path.join(tmp_dir, "batch_requests.jsonl")
+        with open(jsonl_path, "w") as f:
+            for request in requests:
+                f.write(json.dumps(request) + "\n")
+        with open(jsonl_path, "rb") as f:
+            batch_file = client.files.create(file=f, purpose="batch")
+    return client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h",
+    )
+
+def wait_for_batch(client, batch_id, poll_interval=30):
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        print(f"Batch {batch_id}: {batch.status}")
+        if batch.status in ("completed", "failed", "expired", "cancelled"):
+            return batch
+        time.sleep(poll_interval)
+
+def print_batch_results(client, file_id):
+    # Successful requests land in output_file_id, failed ones in error_file_id
+    for line in client.files.content(file_id).text.splitlines():
+        result = json.loads(line)
+        print(f"--- {result['custom_id']} ---")
+        response = result.get("response") or {}
+        if result.get("error") or response.get("status_code") != 200:
+            print(f"Error: {result.get('error') or response.get('body')}")
+        else:
+            print(response["body"]["choices"][0]["message"]["content"])
+
+# Paths to the image files
+image_paths = ["./data/competitor_menu.png"]
+
+base_url = 'http://192.168.1.23:11434/v1/'
+model = "gemma3:27b"
+# The Batch API halves cost for bulk ingestion but only exists on api.openai.com
+use_batch_api = "api.openai.com" in base_url
+
+# Encode every image once up front; a missing file surfaces as FileNotFoundError from open()
+data_urls = {}
+for image_path in image_paths:
+    try:
+        data_urls[image_path] = encode_image_to_data_url(image_path)
+    except FileNotFoundError:
+        print(f"Error: Image file '{image_path}' not found.")
+        exit(1)
+    except (OSError, ValueError) as e:
+        # mmap raises ValueError for an empty file
+        print(f"Error encoding image '{image_path}': {repr(e)}")
+        exit(1)
+
+client = OpenAI(
+    base_url=base_url,
+    api_key=os.environ.get("OPENAI_API_KEY", "ollama"), # required but ignored by Ollama
 )
 
-print(chat_completion.choices[0].message.content)
\ No newline at end of file
+if use_batch_api:
+    requests = [
+        {
+            "custom_id": image_path,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {"model": model, "messages": build_messages(data_urls[image_path])},
+        }
+        for image_path in image_paths
+    ]
+    batch = wait_for_batch(client, submit_batch(client, requests).id)
+    if batch.status != "completed":
+        print(f"Error: Batch {batch.id} ended with status '{batch.status}'.")
+        exit(1)
+    if batch.request_counts and batch.request_counts.failed:
+        print(f"Warning: {batch.request_counts.failed} of {batch.request_counts.total} request(s) in batch {batch.id} failed.")
+    if not batch.output_file_id and not batch.error_file_id:
+        print(f"Error: Batch {batch.id} completed without any output or error file.")
+        exit(1)
+
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if file_id:
+            print_batch_results(client, file_id)
+else:
+    for image_path in image_paths:
+        chat_completion = client.chat.completions.create(
+            model=model,
+            messages=build_messages(data_urls[image_path]),
+        )
+        print(chat_completion.choices[0].message.content)
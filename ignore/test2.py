@@ -1,25 +1,82 @@
 # describe_image.py
+import asyncio
 import base64
+import functools
+import hashlib
+import io
+import itertools
 import os, json
 import traceback
-from typing import List, Optional
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import List, NamedTuple, Optional, Tuple
+import httpx
+import ijson
+from diskcache import Cache
+from openai import APIConnectionError, RateLimitError
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage
-from pydantic import BaseModel, Field
+from langchain_core.runnables import Runnable
+from PIL import Image, ImageOps
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
 
 # --- Configuration ---
-OLLAMA_BASE_URL = "http://192.168.1.23:11434/v1" # Replace with your Ollama IP if not localhost
-# IMPORTANT: Choose a multimodal model served by your Ollama instance
-OLLAMA_VISION_MODEL = "gemma3:27b"
-# Provide the path to the image you want to describe
-IMAGE_PATH = "./data/competitor_menu.png" # <<< CHANGE THIS TO YOUR IMAGE PATH
+@dataclass(frozen=True)
+class Config:
+    # One entry per Ollama server; requests are spread round-robin across them.
+    # To use a load-balancing proxy (e.g. ollamaMQ, olol) instead, list just the proxy URL.
+    ollama_urls: Tuple[str, ...] = (
+        "http://192.168.1.23:11434/v1", # Replace with your Ollama IP if not localhost
+    )
+    # IMPORTANT: Choose a multimodal model served by your Ollama instance
+    ollama_vision_model: str = "gemma3:27b"
+
+# Provide the paths to the images you want to describe
+IMAGE_PATHS = [
+    "./data/competitor_menu.png", # <<< CHANGE/ADD YOUR IMAGE PATHS
+]
+# Max in-flight requests per backend; keep at or below each server's OLLAMA_NUM_PARALLEL
+MAX_CONCURRENCY = 4
+# Shared HTTP connection pool; keep-alive connections are reused across requests.
+# HTTP/2 needs the `h2` package and is only negotiated over TLS (plain http:// stays on HTTP/1.1).
+HTTP_TIMEOUT = 120
+HTTP_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32)
+# Images sent per request; size so K images + prompt fit the model's context window
+IMAGES_PER_REQUEST = 4
+# Extracted menus are cached on disk so reruns skip images already processed
+CACHE_DIR = "./.llm_cache"
+# Images are downscaled and re-encoded as JPEG before upload (in a process pool);
+# fewer pixels means fewer vision patches to prefill and fewer bytes on the wire
+IMAGE_MAX_SIZE = (1024, 1024)
+# Text-heavy menus read just as well in grayscale with stretched contrast, at a fraction of the size
+IMAGE_GRAYSCALE = True
+IMAGE_JPEG_QUALITY = 85
+IMAGE_MIME_TYPE = "image/jpeg"
+
+# --- Helper Functions ---
+def to_data_url(view, mime_type):
+    """Base64-encodes a bytes-like view into a data URL string."""
+    return f"data:{mime_type};base64," + base64.b64encode(view).decode("ascii")
+
 
-# --- Helper Function ---
 def encode_image(image_path):
-    """Encodes an image file into a base64 string."""
+    """Downscales an image and encodes it as a JPEG data URL, built once and reused per request.
+
+    CPU-bound; run it in a process pool when encoding many images.
+    """
     try:
-        with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode('utf-8')
+        with Image.open(image_path) as img:
+            img = ImageOps.exif_transpose(img) # Respect camera orientation for menu photos
+            if IMAGE_GRAYSCALE:
+                img = ImageOps.autocontrast(img.convert("L"))
+            else:
+                img = img.convert("RGB") # JPEG has no alpha channel
+            img.thumbnail(IMAGE_MAX_SIZE, Image.LANCZOS)
+            buf = io.BytesIO()
+            img.save(buf, "JPEG", quality=IMAGE_JPEG_QUALITY)
+        with buf.getbuffer() as view:
+            return to_data_url(view, IMAGE_MIME_TYPE)
     except FileNotFoundError:
         print(f"Error: Image file not found at {image_path}")
         return None
@@ -28,100 +85,254 @@ def encode_image(image_path):
         return None
 
 
+# extra="forbid" and required (nullable) fields keep the schema valid for strict structured outputs
 class CompetitorMenuItem(BaseModel):
+    model_config = ConfigDict(extra="forbid")
     item_name: str = Field(...)
-    price: Optional[float] = None
+    price: Optional[float] = Field(..., description="null if the price is missing or unreadable")
 
 class CompetitorMenu(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    image_index: int = Field(..., description="0-based position of the image within the request")
     items: List[CompetitorMenuItem]
 
+class CompetitorMenuBatch(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    results: List[CompetitorMenu]
 
-schema_desc = json.dumps(CompetitorMenu.model_json_schema())
-prompt_text = (
-    "Analyze the menu in the provided image. Extract all distinct menu items and their corresponding prices. "
-    "Format the output strictly as a JSON string representing a list of objects. "
-    "Each object must have keys 'item_name' (string) and 'price' (float or null if price is missing or unreadable). "
-    "Ignore headers, descriptions, or non-item text. Consolidate slightly different phrasings of the same item if possible. "
-    "Only output the valid JSON string, with no surrounding text, explanations, or markdown fences.\n"
-    # f"The required JSON structure is described by this schema: {schema_desc}\n"
-    "Example: '[{\"item_name\": \"Classic Burger\", \"price\": 6.50}, {\"item_name\": \"Fries\", \"price\": 2.50}, {\"item_name\": \"Soda\", \"price\": null}]'"
-)
 
+# Built on first use rather than at import, so importing this module stays cheap
+@functools.lru_cache(maxsize=1)
+def get_response_format():
+    """JSON Schema response_format; the server constrains decoding to it, so replies are always valid JSON."""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "CompetitorMenuBatch",
+            "schema": CompetitorMenuBatch.model_json_schema(),
+            "strict": True,
+        },
+    }
 
 
+@functools.lru_cache(maxsize=1)
+def get_prompt_text():
+    """Instruction text sent alongside every batch of images."""
+    return (
+        "Analyze the menus in the provided images. The images are numbered by their order in this message, starting at 0. "
+        "For each image, extract all distinct menu items and their corresponding prices, returning one result per image. "
+        "Ignore headers, descriptions, or non-item text. Consolidate slightly different phrasings of the same item if possible."
+    )
 
 
+# --- Async Helpers ---
+class Backend(NamedTuple):
+    url: str
+    model: str
+    llm: Runnable
+    semaphore: asyncio.Semaphore
 
 
-# --- Main Execution ---
-if __name__ == "__main__":
-    print(f"Attempting to describe image: {IMAGE_PATH}")
-    print(f"Using Ollama model: {OLLAMA_VISION_MODEL} at {OLLAMA_BASE_URL}")
-    print(prompt_text)
-    print("-----------------\n\n")
-    print(f"The required JSON structure is described by this schema: {schema_desc}\n")
+def build_prompt_message(data_urls):
+    """Builds one multimodal HumanMessage holding every encoded image of a batch."""
+    # The message content needs to be a list containing text and image data
+    content = [
+        {
+            "type": "image_url",
+            "image_url": {"url": data_url}
+        }
+        for data_url in data_urls
+    ]
+    content.append({"type": "text", "text": get_prompt_text()})
+    return HumanMessage(content=content)
 
-    # 1. Check if image exists
-    if not os.path.exists(IMAGE_PATH):
-        print(f"Error: Cannot find image file at '{IMAGE_PATH}'. Please check the path.")
-        exit()
 
-    # 2. Encode the image
-    base64_image = encode_image(IMAGE_PATH)
-    if not base64_image:
-        print("Exiting due to image encoding error.")
-        exit()
+def cache_key(data_url, model):
+    """Content-addressable key: same image, prompt and model always hit the same entry."""
+    payload = data_url + get_prompt_text() + model
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
 
-    print("Image encoded successfully.")
 
-    # 3. Initialize ChatOpenAI client for Ollama
-    try:
-        llm = ChatOpenAI(
-            base_url=OLLAMA_BASE_URL,
-            model=OLLAMA_VISION_MODEL,
-            api_key="ollama",  # Required by ChatOpenAI, but value ignored by Ollama
-            temperature=0.1    # Lower temperature for more factual description
-        )
-        print("ChatOpenAI client initialized.")
-    except Exception as e:
-        print(f"Error initializing ChatOpenAI: {repr(e)}")
-        print(traceback.format_exc())
-        exit()
+def chunk_paths(paths, size):
+    """Splits the image paths into consecutive groups of at most `size`."""
+    return [paths[i:i + size] for i in range(0, len(paths), size)]
 
-    # 4. Prepare the prompt message
-    # The message content needs to be a list containing text and image data
-    # Assuming JPEG/PNG works with this data URI format, adjust mime type if needed (e.g., image/png)
-    prompt_message = HumanMessage(
-        content=[
-            {
-                "type": "text",
-                "text": f"{prompt_text}"
-            },
-            {
-                "type": "image_url",
-                "image_url": {"url": f"data:image/png;base64,{base64_image}"} # Adjust mime type if necessary
-            },
-        ]
-    )
-    print("Prompt message constructed.")
 
-    # 5. Invoke the LLM and print the response
-    try:
-        print("\n--- Calling Vision LLM ---")
-        response = llm.invoke([prompt_message]) # Pass messages as a list
-        print("--- LLM Call Complete ---")
-        print("\n--- Image Description ---")
-        print(response.content)
-        print("-------------------------\n")
+@retry(
+    wait=wait_random_exponential(min=1, max=30),
+    stop=stop_after_attempt(6),
+    # APITimeoutError (wrapped read timeouts) is a subclass of APIConnectionError
+    retry=retry_if_exception_type((RateLimitError, APIConnectionError)),
+    reraise=True,
+)
+async def stream_response(backend, prompt_message, paths, reported):
+    """Streams the LLM reply, reporting each menu as soon as its JSON object closes.
+
+    `paths` label the images in the request, in the order the model indexes them;
+    `reported` collects the indices already announced, so retries don't repeat them.
+    Returns the full accumulated text. Incremental parsing goes through ijson's
+    push interface, so partial chunks are never handed to json.loads.
+    Transient connection/rate-limit errors restart the stream with jittered
+    exponential backoff; only this batch is retried, other batches are unaffected.
+    The backend slot is held per attempt, not through the backoff sleeps.
+    """
+    buf = ""
+    events = ijson.sendable_list()
+    parser = ijson.items_coro(events, "results.item")
+    parsing = True
+    async with backend.semaphore:
+        async for chunk in backend.llm.astream([prompt_message]): # Pass messages as a list
+            buf += chunk.content
+            # An empty send tells ijson the input has ended, so skip empty chunks
+            if not parsing or not chunk.content:
+                continue
+            try:
+                parser.send(chunk.content.encode("utf-8"))
+            except ijson.JSONError as e:
+                # Only reachable if the server ignored response_format; leave it to the final parse
+                print(f"Incremental parse stopped for {paths}: {repr(e)}")
+                parsing = False
+            for obj in events:
+                try:
+                    menu = CompetitorMenu.model_validate(obj)
+                except ValidationError as e:
+                    # Progress reporting only; the final parse decides what is kept
+                    print(f"Skipping off-schema streamed menu for {paths}: {repr(e)}")
+                    continue
+                if 0 <= menu.image_index < len(paths) and menu.image_index not in reported:
+                    reported.add(menu.image_index)
+                    print(f"Streamed menu for {paths[menu.image_index]}: {len(menu.items)} item(s)")
+            del events[:]
+    return buf
 
+
+async def describe_image_batch(backend, cache, pool, image_paths):
+    """Encodes a group of images and extracts all uncached menus with one LLM call.
+
+    Returns (path, items) pairs, items being None when no menu could be extracted.
+    Only the items are cached: image_index is the position within one request,
+    so it means nothing to a later run.
+    """
+    # Decoding/resizing runs in worker processes so it neither blocks the event loop nor holds the GIL
+    loop = asyncio.get_running_loop()
+    encoded = await asyncio.gather(*[loop.run_in_executor(pool, encode_image, path) for path in image_paths])
+    menus = {}
+    # Identical images share a cache key; send each distinct one to the model once
+    pending = {}
+    for path, data_url in zip(image_paths, encoded):
+        if not data_url:
+            continue
+        key = cache_key(data_url, backend.model)
+        if key in pending:
+            pending[key][1].append(path)
+            continue
+        cached = cache.get(key)
+        if isinstance(cached, str) and cached.startswith("["):
+            print(f"Cache hit for {path}")
+            menus[path] = [CompetitorMenuItem.model_validate(item) for item in json.loads(cached)]
+        else:
+            pending[key] = (data_url, [path])
+    if not pending:
+        return [(path, menus.get(path)) for path in image_paths]
+
+    batch = list(pending.items())
+    prompt_message = build_prompt_message([data_url for _, (data_url, _) in batch])
+    labels = [" = ".join(paths) for _, (_, paths) in batch]
+    try:
+        content = await stream_response(backend, prompt_message, labels, set())
     except Exception as e:
-        print(f"\n--- Error during LLM invocation ---")
+        print(f"\n--- Error during LLM invocation for {image_paths} ---")
         print(f"An error occurred: {repr(e)}")
         print("Check if:")
-        print(f" - Ollama is running at {OLLAMA_BASE_URL}")
-        print(f" - The model '{OLLAMA_VISION_MODEL}' is downloaded and available in Ollama (`ollama list`)")
+        print(f" - Ollama is running at {backend.url}")
+        print(f" - The model '{backend.model}' is downloaded and available in Ollama (`ollama list`)")
         print(" - Ollama service logs show any specific errors (memory, etc.)")
         print(traceback.format_exc())
         print("----------------------------------\n")
+        return [(path, menus.get(path)) for path in image_paths]
+
+    try:
+        parsed = CompetitorMenuBatch.model_validate_json(content)
+    except Exception as e:
+        print(f"Error parsing LLM output for {image_paths}: {repr(e)}")
+        print(content)
+        return [(path, menus.get(path)) for path in image_paths]
+
+    menus_by_index = {menu.image_index: menu for menu in parsed.results}
+    for i, (key, (_, paths)) in enumerate(batch):
+        menu = menus_by_index.get(i)
+        if menu is not None:
+            cache.set(key, json.dumps([item.model_dump() for item in menu.items]))
+            for path in paths:
+                menus[path] = menu.items
+    return [(path, menus.get(path)) for path in image_paths]
+
+
+async def main(config=None):
+    config = config or Config()
+    response_format = get_response_format()
+    print(f"Attempting to describe {len(IMAGE_PATHS)} image(s): {IMAGE_PATHS}")
+    print(f"Using Ollama model: {config.ollama_vision_model} at {list(config.ollama_urls)}")
+    print(get_prompt_text())
+    print("-----------------\n\n")
+    print(f"The required JSON structure is described by this schema: {json.dumps(response_format['json_schema']['schema'])}\n")
+
+    # 1. Initialize one ChatOpenAI client per Ollama backend, all sharing one connection pool
+    # Pool size and HTTP/2 are transport settings, since a custom transport is supplied
+    http_client = httpx.AsyncClient(
+        timeout=HTTP_TIMEOUT,
+        transport=httpx.AsyncHTTPTransport(http2=True, limits=HTTP_LIMITS, retries=2),
+    )
+    async with http_client:
+        try:
+            backends = [
+                Backend(
+                    url=url,
+                    model=config.ollama_vision_model,
+                    llm=ChatOpenAI(
+                        base_url=url,
+                        model=config.ollama_vision_model,
+                        api_key="ollama",  # Required by ChatOpenAI, but value ignored by Ollama
+                        temperature=0.1,   # Lower temperature for more factual description
+                        max_retries=0,     # stream_response's tenacity policy is the only retry layer
+                        http_async_client=http_client,
+                    ).bind(response_format=response_format),
+                    semaphore=asyncio.Semaphore(MAX_CONCURRENCY),
+                )
+                for url in config.ollama_urls
+            ]
+            print(f"{len(backends)} ChatOpenAI client(s) initialized.")
+        except Exception as e:
+            print(f"Error initializing ChatOpenAI: {repr(e)}")
+            print(traceback.format_exc())
+            return
+
+        # 2. Encode and query all image groups concurrently, round-robin across backends.
+        #    Missing files are reported by encode_image (FileNotFoundError) rather than pre-checked.
+        print("\n--- Calling Vision LLM ---")
+        backend_cycle = itertools.cycle(backends)
+        # No more worker processes than there are images to encode
+        encode_workers = max(1, min(os.cpu_count() or 1, len(IMAGE_PATHS)))
+        with Cache(CACHE_DIR) as cache, ProcessPoolExecutor(max_workers=encode_workers) as pool:
+            batches = await asyncio.gather(
+                *[
+                    describe_image_batch(next(backend_cycle), cache, pool, group)
+                    for group in chunk_paths(IMAGE_PATHS, IMAGES_PER_REQUEST)
+                ]
+            )
+        print("--- LLM Calls Complete ---")
 
-    print("Script finished.")
\ No newline at end of file
+    # 3. Print the extracted menus
+    for image_path, items in (result for batch in batches for result in batch):
+        print(f"\n--- Extracted Menu: {image_path} ---")
+        if items is not None:
+            print(json.dumps([item.model_dump() for item in items], indent=2))
+        else:
+            print("No response (see errors above).")
+        print("-------------------------\n")
+
+
+# --- Main Execution ---
+if __name__ == "__main__":
+    asyncio.run(main())
+    print("Script finished.")
@@ -1,6 +1,6 @@
-import json
+import ijson
 from sqlalchemy import create_engine, Column, Integer, Float, String, ForeignKey
-from sqlalchemy.orm import declarative_base, relationship, Session
+from sqlalchemy.orm import declarative_base, relationship
 
 Base = declarative_base()
 
@@ -25,36 +25,107 @@ class NutritionFacts(Base):
     sodium_mg = Column(Integer)
     item = relationship("MenuItem", back_populates="nutrition")
 
-def build_qsr_menu_database(json_path: str = "./data/menu.json", db_path: str = "sqlite:///./data/qsr_menu.db"):
-    """Creates and populates the QSR menu database from a JSON file."""
-    with open(json_path, 'r') as file:
-        menu_data = json.load(file)
+# Trades durability for speed, only on the connection doing the one-shot load
+_SQLITE_LOAD_PRAGMAS = {
+    "synchronous": "OFF",
+    "temp_store": "MEMORY",
+    "cache_size": "-200000",
+}
+
+def _set_pragmas(cursor, pragmas, previous=None):
+    """Sets SQLite pragmas on one connection.
+
+    If `previous` is given, each pragma's old value is recorded there before it
+    is changed, so a failure partway through can still be undone.
+    """
+    for name, value in pragmas.items():
+        if previous is not None:
+            cursor.execute(f"PRAGMA {name}")
+            previous[name] = cursor.fetchone()[0]
+        cursor.execute(f"PRAGMA {name}={value}")
+
+# Positional placeholder per DBAPI paramstyle; rows are plain tuples
+_PLACEHOLDERS = {"qmark": "?", "format": "%s", "pyformat": "%s"}
 
+def _insert_sql(table, paramstyle):
+    """Renders a fixed-shape INSERT for every column of table, in column order."""
+    placeholder = _PLACEHOLDERS.get(paramstyle)
+    if placeholder is None:
+        raise ValueError(f"Unsupported DBAPI paramstyle for bulk load: {paramstyle!r}")
+    columns = ", ".join(column.name for column in table.columns)
+    values = ", ".join(placeholder for _ in table.columns)
+    return f"INSERT INTO {table.name} ({columns}) VALUES ({values})"
+
+def _menu_batches(menu_items, batch_size):
+    """Yields (menu_rows, nutrition_rows) lists of at most batch_size items each.
+
+    Rows are tuples in the column order of the menu and nutrition_facts tables.
+    """
+    # Tables are freshly recreated, so ids can be assigned up front and the
+    # nutrition rows linked without a round-trip per item
+    menu_rows = []
+    nutrition_rows = []
+    for item_id, item in enumerate(menu_items, start=1):
+        nutrition = item["nutrition"]
+        menu_rows.append((item_id, item["name"], item["category"], item["price"], item["ingredients"]))
+        nutrition_rows.append((
+            item_id,
+            nutrition["calories"],
+            nutrition["protein_g"],
+            nutrition["fat_g"],
+            nutrition["carbs_g"],
+            nutrition["sodium_mg"],
+        ))
+        if len(menu_rows) >= batch_size:
+            yield menu_rows, nutrition_rows
+            menu_rows = []
+            nutrition_rows = []
+    if menu_rows:
+        yield menu_rows, nutrition_rows
+
+def build_qsr_menu_database(json_path: str = "./data/menu.json", db_path: str = "sqlite:///./data/qsr_menu.db", batch_size: int = 1000):
+    """Creates and populates the QSR menu database from a JSON file."""
     engine = create_engine(db_path)
     Base.metadata.drop_all(engine)
     Base.metadata.create_all(engine)
 
-    with Session(engine) as session:
-        for item in menu_data:
-            menu_item = MenuItem(
-                name=item["name"],
-                category=item["category"],
-                price=item["price"],
-                ingredients=item["ingredients"]
-            )
-            nutrition = NutritionFacts(
-                calories=item["nutrition"]["calories"],
-                protein_g=item["nutrition"]["protein_g"],
-                fat_g=item["nutrition"]["fat_g"],
-                carbs_g=item["nutrition"]["carbs_g"],
-                sodium_mg=item["nutrition"]["sodium_mg"],
-                item=menu_item
-            )
-            session.add(menu_item)
-            session.add(nutrition)
-
-        session.commit()
+    # One-shot load: skip SQLAlchemy's per-batch statement compilation and run
+    # the prepared SQL straight through the DBAPI in a single transaction
+    paramstyle = engine.dialect.paramstyle
+    menu_sql = _insert_sql(MenuItem.__table__, paramstyle)
+    nutrition_sql = _insert_sql(NutritionFacts.__table__, paramstyle)
+    conn = engine.raw_connection()
+    cursor = conn.cursor()
+    # The connection goes back to the engine's pool afterwards, so restore the pragmas
+    pragmas_to_restore = {}
+    try:
+        if engine.dialect.name == "sqlite":
+            _set_pragmas(cursor, _SQLITE_LOAD_PRAGMAS, pragmas_to_restore)
+        # Stream the menu instead of loading it whole; binary mode lets ijson use its C backend
+        with open(json_path, 'rb') as file:
+            menu_items = ijson.items(file, "item", use_float=True)
+            for menu_rows, nutrition_rows in _menu_batches(menu_items, batch_size):
+                cursor.executemany(menu_sql, menu_rows)
+                cursor.executemany(nutrition_sql, nutrition_rows)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        restored = True
+        try:
+            _set_pragmas(cursor, pragmas_to_restore)
+        except Exception as e:
+            # Don't mask the load error; the connection is discarded below instead of pooled
+            print(f"Warning: could not restore SQLite pragmas ({repr(e)}); discarding the load connection")
+            restored = False
+        finally:
+            try:
+                cursor.close()
+            finally:
+                if not restored:
+                    conn.invalidate()
+                conn.close()
 
     print(f"Database created and populated from {json_path}")
     return engine
-    
\ No newline at end of file
@@ -1,12 +1,28 @@
+import logging
 from typing import List, Dict, Optional, Any
 from langchain_core.messages import AIMessage, BaseMessage
 
+logger = logging.getLogger(__name__)
+
+def _answer_from_tool_call(tool_call: Dict[str, Any], final_answer_tool_name: str) -> Optional[str]:
+    """Pulls the 'answer' argument out of the final-answer tool call."""
+    args = tool_call["args"]
+    if not isinstance(args, dict):
+        logger.debug("Tool '%s' called, but 'args' not a dictionary. Tool call arguments: %s", final_answer_tool_name, args)
+        return None
+    # Assumes the answer is in the 'answer' key of the args dict
+    answer = args.get("answer")
+    if answer is None:
+        logger.debug("Tool '%s' called, but 'answer' argument missing/None. Tool call arguments: %s", final_answer_tool_name, args)
+    return answer
+
 def extract_final_response(result: Dict[str, Any], final_answer_tool_name: str) -> Optional[str]:
     """
     Extracts the final answer from a LangGraph result state.
 
     Checks for a specific tool call in the last AIMessage first,
     then falls back to the content of the last AIMessage.
+    Diagnostics are emitted through this module's logger at DEBUG level.
 
     Args:
         result: The dictionary result from graph.invoke().
@@ -17,61 +33,38 @@ def extract_final_response(result: Dict[str, Any], final_answer_tool_name: str)
     Returns:
         The extracted answer string, or None if no suitable answer is found.
     """
-    print("--- Processing Final Result ---")
     final_state_messages: List[BaseMessage] = result.get("messages", [])
-
     if not final_state_messages:
-        print("Error: No messages found in the final state.")
+        logger.debug("No messages found in the final state.")
         return None
 
     final_msg = final_state_messages[-1]
-    print(f"Final message type: {type(final_msg).__name__}")
-
-    extracted_answer = None
-    is_tool_call_answer = False
-    found_specific_tool = False
-
-    # 1. Check for the specific tool call in the last AIMessage
-    if isinstance(final_msg, AIMessage) and final_msg.tool_calls:
-        print(f"Found {len(final_msg.tool_calls)} tool call(s) in the final message.")
-        for tool_call in final_msg.tool_calls:
-            # Check if THIS tool call is the one we want
-            if tool_call.get("name") == final_answer_tool_name:
-                found_specific_tool = True
-                is_tool_call_answer = True # Mark that answer came from the correct tool
-                print(f"  Processing '{final_answer_tool_name}' tool call.")
-                args = tool_call.get("args")
-                if isinstance(args, dict):
-                    # Assumes the answer is in the 'answer' key of the args dict
-                    extracted_answer = args.get("answer")
-                    if extracted_answer is None:
-                        print(f"  Tool '{final_answer_tool_name}' called, but 'answer' argument missing/None.")
-                        print(f"  Tool call arguments: {args}")
-                else:
-                    print(f"  Tool '{final_answer_tool_name}' called, but 'args' not a dictionary.")
-                    print(f"  Tool call arguments: {args}")
-                # Once found and processed, break the loop
-                break
-            else:
-                print(f"  Ignoring tool call: {tool_call.get('name')}") # Log other calls found
+    if not isinstance(final_msg, AIMessage):
+        logger.debug("Final message is a %s, not an AIMessage: %s", type(final_msg).__name__, final_msg)
+        return None
 
-        if not found_specific_tool:
-             print(f"Found tool calls, but none were '{final_answer_tool_name}'.")
+    tool_calls = final_msg.tool_calls
+    # Common case: plain AI content with no tool calls
+    if not tool_calls:
+        return final_msg.content or None
 
-    # 2. Fallback: Check direct AI content ONLY if the specific tool wasn't found/processed
-    if not found_specific_tool and isinstance(final_msg, AIMessage) and final_msg.content:
-        print(f"No '{final_answer_tool_name}' tool call processed. Checking direct AI content.")
-        extracted_answer = final_msg.content
-        is_tool_call_answer = False # Mark that it came from content
+    # Common case: the final answer tool is the only/first call
+    tool_call = tool_calls[0]
+    if tool_call["name"] != final_answer_tool_name:
+        # Reversed so the first call wins if the same tool was called more than once
+        calls_by_name = {tc["name"]: tc for tc in reversed(tool_calls)}
+        tool_call = calls_by_name.get(final_answer_tool_name)
 
-    # 3. Final Logging
-    if extracted_answer:
-        source = "Tool Call" if is_tool_call_answer else "AI Content"
-        print(f"Successfully extracted answer from: {source}")
-    else:
-        print("Could not extract a final answer via tool call or direct content.")
-        print("Final Message Details:")
-        print(final_msg) # Print the whole message for debugging if no answer found
+    if tool_call is not None:
+        return _answer_from_tool_call(tool_call, final_answer_tool_name)
 
-    print("--- Finished Processing Result ---")
-    return extracted_answer
\ No newline at end of file
+    # Fallback: the specific tool wasn't called, use direct AI content
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            "Found tool calls %s, but none were '%s'. Checking direct AI content.",
+            [tc["name"] for tc in tool_calls], final_answer_tool_name,
+        )
+    if final_msg.content:
+        return final_msg.content
+    logger.debug("Could not extract a final answer via tool call or direct content. Final message: %s", final_msg)
+    return None